@@ -1,14 +1,19 @@
 import os
+import re
 import glob
+import asyncio
 import hashlib
 from dataclasses import dataclass
-from typing import Iterable, List, Tuple
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
 
+import numpy as np
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
 
 from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 
 
 load_dotenv()
@@ -21,6 +26,7 @@ AOAI_EMBED_ENDPOINT = os.environ["AZURE_OPENAI_EMBED_ENDPOINT"]
 AOAI_EMBED_KEY = os.environ["AZURE_OPENAI_EMBED_API_KEY"]
 AOAI_EMBED_DEPLOYMENT = os.environ["AZURE_OPENAI_EMBED_DEPLOYMENT"]  # deployment name
 EMBED_DIM = 1536  # text-embedding-3-small
+EMBED_CACHE_DIR = Path(os.getenv("EMBED_CACHE_DIR", ".embed_cache"))
 
 
 @dataclass
@@ -32,47 +38,50 @@ class Chunk:
     content: str
 
 
+HEADER_RE = re.compile(r"^(TITLE|SOURCE|CITY):(.*)$", re.MULTILINE)
+
+
 def parse_header(text: str) -> Tuple[str, str, str]:
     # Expected lines like:
     # TITLE: ...
     # SOURCE: ...
     # CITY: ...
-    title = ""
-    source = ""
-    city = ""
-    for line in text.splitlines()[:20]:
-        if line.startswith("TITLE:"):
-            title = line.split(":", 1)[1].strip()
-        elif line.startswith("SOURCE:"):
-            source = line.split(":", 1)[1].strip()
-        elif line.startswith("CITY:"):
-            city = line.split(":", 1)[1].strip()
-    return title, source, city
+    # Only the header area (first ~2 KB) is scanned; the rest of the document is never split.
+    meta = {m.group(1): m.group(2).strip() for m in HEADER_RE.finditer(text, 0, 2048)}
+    return meta.get("TITLE", ""), meta.get("SOURCE", ""), meta.get("CITY", "")
 
 
 def chunk_text(text: str, chunk_size: int = 1100, overlap: int = 200) -> List[str]:
     # Simple char-based chunker (good enough for MVP)
+    # Window bounds are computed in one vectorized step: starts advance by (chunk_size - overlap)
+    # and the last window is the first one reaching the end of the text.
+    # Whitespace is trimmed by moving the (start, end) bounds instead of slicing + .strip(),
+    # so only the final chunk strings are allocated.
     text = text.strip()
+    n = len(text)
+    starts = np.arange(0, max(1, n - overlap), chunk_size - overlap)
+    ends = np.minimum(starts + chunk_size, n)
+
     chunks = []
-    i = 0
-    while i < len(text):
-        j = min(len(text), i + chunk_size)
-        chunk = text[i:j].strip()
-        if chunk:
-            chunks.append(chunk)
-        if j == len(text):
-            break
-        i = max(0, j - overlap)
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        while s < e and text[s].isspace():
+            s += 1
+        while e > s and text[e - 1].isspace():
+            e -= 1
+        if s < e:
+            chunks.append(text[s:e])
     return chunks
 
 
 def make_id(source: str, chunk_id: int) -> str:
+    # ids are the Azure Search document keys: changing the hash would re-upload every chunk
+    # under a new key and leave the old documents behind as duplicates, so keep SHA-1
     raw = f"{source}:{chunk_id}".encode("utf-8")
     return hashlib.sha1(raw).hexdigest()
 
 
-def build_chunks(path: str) -> List[Chunk]:
-    raw = open(path, "r", encoding="utf-8").read()
+def build_chunks(path: str) -> Iterator[Chunk]:
+    raw = Path(path).read_text(encoding="utf-8")
     title, source, city = parse_header(raw)
     if not source:
         # fallback: use filename
@@ -83,46 +92,136 @@ def build_chunks(path: str) -> List[Chunk]:
     body = parts[1] if len(parts) == 2 else raw
 
     texts = chunk_text(body, chunk_size=1100, overlap=200)
-    out = []
     for idx, t in enumerate(texts):
-        out.append(
-            Chunk(
-                source=source,
-                title=title or os.path.basename(path),
-                page=0,          # TXT => 0
-                chunk_id=idx,
-                content=t,
-            )
+        yield Chunk(
+            source=source,
+            title=title or os.path.basename(path),
+            page=0,          # TXT => 0
+            chunk_id=idx,
+            content=t,
         )
-    return out
 
 
-def embed_texts(client: AzureOpenAI, texts: List[str]) -> List[List[float]]:
+def iter_chunks(files: Iterable[str]) -> Iterator[Chunk]:
+    for f in files:
+        yield from build_chunks(f)
+
+
+async def embed_texts(client: AsyncAzureOpenAI, texts: List[str], concurrency: int = 8) -> List[np.ndarray]:
     # batch embeddings (Azure OpenAI supports batching; keep batches small)
-    vectors: List[List[float]] = []
+    # batches are sent concurrently (bounded by a semaphore) and reassembled in input order
     batch_size = 16
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
-        resp = client.embeddings.create(
-            model=AOAI_EMBED_DEPLOYMENT,
-            input=batch,
-        )
+    batches = [texts[i:i+batch_size] for i in range(0, len(texts), batch_size)]
+    sem = asyncio.Semaphore(concurrency)
+
+    async def embed_batch(batch: List[str]) -> List[np.ndarray]:
+        async with sem:
+            resp = await client.embeddings.create(
+                model=AOAI_EMBED_DEPLOYMENT,
+                input=batch,
+            )
+        out = []
         for item in resp.data:
             vec = item.embedding
             if len(vec) != EMBED_DIM:
                 raise ValueError(f"Embedding dim mismatch: got {len(vec)} expected {EMBED_DIM}")
-            vectors.append(vec)
+            # float32 array (~6 KB) instead of a list of boxed Python floats (~43 KB)
+            out.append(np.asarray(vec, dtype=np.float32))
+        return out
+
+    results = await asyncio.gather(*(embed_batch(b) for b in batches))
+    return [vec for batch_vectors in results for vec in batch_vectors]
+
+
+def _embed_cache_path(text: str) -> Path:
+    # key includes the deployment, so switching embedding models never reuses stale vectors
+    h = hashlib.blake2b(f"{AOAI_EMBED_DEPLOYMENT}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+    return EMBED_CACHE_DIR / h[:2] / f"{h}.f32"
+
+
+async def embed_texts_cached(client: AsyncAzureOpenAI, texts: List[str]) -> List[np.ndarray]:
+    # unchanged chunks are read back from disk; only new/edited ones go to Azure
+    paths = [_embed_cache_path(t) for t in texts]
+    vectors: List[np.ndarray] = [None] * len(texts)
+    misses = []
+    for idx, path in enumerate(paths):
+        if path.exists():
+            vec = np.fromfile(path, dtype=np.float32)
+            if vec.size == EMBED_DIM:
+                vectors[idx] = vec
+                continue
+        misses.append(idx)
+
+    if misses:
+        fresh = await embed_texts(client, [texts[i] for i in misses])
+        for idx, vec in zip(misses, fresh):
+            paths[idx].parent.mkdir(parents=True, exist_ok=True)
+            vec.tofile(paths[idx])
+            vectors[idx] = vec
+    print(f"Embeddings: {len(texts) - len(misses)} from cache, {len(misses)} from Azure")
     return vectors
 
 
-def main():
-    aoai = AzureOpenAI(
+def to_search_doc(c: Chunk, v: np.ndarray) -> dict:
+    return {
+        "id": make_id(c.source, c.chunk_id),
+        "content": c.content,
+        "source": c.source,
+        "page": c.page,
+        "chunk_id": c.chunk_id,
+        "title": c.title,
+        "contentVector": v.tolist(),  # JSON floats only at upload time
+    }
+
+
+async def produce_batches(aoai: AsyncAzureOpenAI, chunks: Iterable[Chunk], queue: asyncio.Queue, batch_size: int):
+    # embed one upload batch at a time and hand it to the uploader;
+    # chunks are pulled lazily, so the corpus is never held in memory as a whole
+    chunks = iter(chunks)
+    try:
+        while True:
+            batch = list(islice(chunks, batch_size))
+            if not batch:
+                break
+            vectors = await embed_texts_cached(aoai, [c.content for c in batch])
+            await queue.put((batch, vectors))
+    except BaseException:
+        # failed or cancelled: the uploader may be gone and the queue full, so the sentinel
+        # must not block; pending batches are dropped (their vectors are in the disk cache)
+        while True:
+            try:
+                queue.put_nowait(None)
+                break
+            except asyncio.QueueFull:
+                queue.get_nowait()
+        raise
+    await queue.put(None)  # sentinel: no more batches
+
+
+async def upload_batches(search: AsyncSearchClient, queue: asyncio.Queue):
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        batch, vectors = item
+        docs = [to_search_doc(c, v) for c, v in zip(batch, vectors)]
+        result = await search.upload_documents(documents=docs)
+        failed = [r for r in result if not r.succeeded]
+        print(f"Uploaded {len(docs)} docs. Failed: {len(failed)}")
+        if failed:
+            print("Example failure:", failed[0])
+
+
+async def run():
+    aoai = AsyncAzureOpenAI(
         api_key=AOAI_EMBED_KEY,
         azure_endpoint=AOAI_EMBED_ENDPOINT,
         api_version="2024-02-01",  # ok for embeddings; if your resource needs another, adjust
+        # no http_client override: the SDK's default httpx client already keeps connections alive
+        # (with larger pool limits than the 8 concurrent embedding batches need)
     )
 
-    search = SearchClient(
+    search = AsyncSearchClient(
         endpoint=SEARCH_ENDPOINT,
         index_name=SEARCH_INDEX,
         credential=AzureKeyCredential(SEARCH_KEY),
@@ -132,39 +231,26 @@ def main():
     if not files:
         raise RuntimeError("No docs found. Put .txt files in ./docs/")
 
-    all_chunks: List[Chunk] = []
-    for f in files:
-        all_chunks.extend(build_chunks(f))
-
-    contents = [c.content for c in all_chunks]
-    vectors = embed_texts(aoai, contents)
-
-    docs = []
-    for c, v in zip(all_chunks, vectors):
-        docs.append(
-            {
-                "id": make_id(c.source, c.chunk_id),
-                "content": c.content,
-                "source": c.source,
-                "page": c.page,
-                "chunk_id": c.chunk_id,
-                "title": c.title,
-                "contentVector": v,
-            }
-        )
-
-    # Upload in batches
-    batch_size = 200
-    for i in range(0, len(docs), batch_size):
-        batch = docs[i:i+batch_size]
-        result = search.upload_documents(documents=batch)
-        failed = [r for r in result if not r.succeeded]
-        print(f"Uploaded {len(batch)} docs. Failed: {len(failed)}")
-        if failed:
-            print("Example failure:", failed[0])
+    # Pipeline: batch N uploads while batch N+1 is being embedded.
+    # The bounded queue keeps at most a couple of batches of vectors in memory.
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+    async with search, aoai:
+        producer = asyncio.create_task(produce_batches(aoai, iter_chunks(files), queue, batch_size=200))
+        try:
+            await upload_batches(search, queue)
+        except BaseException:
+            # upload failed: stop embedding instead of leaving the producer blocked on a full queue
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            raise
+        await producer  # re-raises an embedding error after the queued batches were uploaded
 
     print("Done.")
 
 
+def main():
+    asyncio.run(run())
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
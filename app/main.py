@@ -1,38 +1,198 @@
 import os
+import re
 import time
+import asyncio
+import hashlib
+import hmac
 import logging
-import pyodbc
+import unicodedata
+import aioodbc
+import orjson
+import numpy as np
 from typing import List, Optional
 from contextlib import asynccontextmanager
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from openai import AsyncAzureOpenAI 
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.aio import SearchClient
+from routing import SQL_CACHE, SQL_RE, SEARCH_RE, STRUCTURED_RE, get_sql_data
+
+# Opțional: embedder local (ONNX) pentru lookup-ul în cache-ul semantic
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-clients = {}
+class Clients:
+    # Singleton-uri create o singură dată în lifespan; acces prin atribut pe hot path
+    search: SearchClient
+    openai: AsyncAzureOpenAI
+    embed: Optional[AsyncAzureOpenAI] = None
+    sql_pool: Optional[aioodbc.pool.Pool] = None
+    l1_cache: TTLCache
+    semantic_cache: "SemanticCache"
+    embedder: Optional["SentenceTransformer"] = None
+    warmup_task: Optional[asyncio.Task] = None
+
+clients = Clients()
+cache_stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0}
+
+LLM_TEMPERATURE = 0.2
+# Răspunsurile sunt scurte (turism), deci limităm generarea: latență și cost mărginite
+LLM_OPTIONS = {
+    "temperature": LLM_TEMPERATURE,
+    "max_tokens": int(os.getenv("LLM_MAX_TOKENS", "400")),
+    "stop": ["\nCitations:", "\n\n\n"],
+    "presence_penalty": 0,
+    "frequency_penalty": 0,
+}
+# Răspunsurile sunt cache-uite doar când generarea e (aproape) deterministă
+CACHE_ENABLED = LLM_TEMPERATURE <= 0.2
+
+EMBED_BATCH_SIZE = 2048
+# Ex: sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2 (necesită sentence-transformers + onnxruntime)
+SEMANTIC_CACHE_LOCAL_MODEL = os.getenv("SEMANTIC_CACHE_LOCAL_MODEL")
+# Fișier opțional cu întrebări frecvente (una pe linie) pentru încălzirea cache-ului la startup
+CACHE_WARMUP_FILE = os.getenv("CACHE_WARMUP_FILE")
+
+# Cache L1 (exact match pe întrebarea normalizată)
+L1_CACHE_MAX_ENTRIES = int(os.getenv("L1_CACHE_MAX_ENTRIES", "10000"))
+L1_CACHE_TTL_SEC = int(os.getenv("L1_CACHE_TTL_SEC", "3600"))
+
+# Cache semantic (in-memory): întrebări parafrazate -> același răspuns
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SEC = int(os.getenv("SEMANTIC_CACHE_TTL_SEC", "86400"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+
+class SemanticCache:
+    # Matrice numpy cu embedding-uri normalizate; similaritatea cosinus devine un produs scalar.
+    # Suficient pentru un singur worker / deployment mic (fără Redis).
+    # Buffer circular prealocat (max_entries, dim): store() scrie un singur rând, fără copierea
+    # întregii matrice; intrările expirate sunt doar mascate la lookup.
+    def __init__(self, threshold: float, ttl_sec: int, max_entries: int):
+        self.threshold = threshold
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self._vectors: Optional[np.ndarray] = None  # alocat la primul store (dimensiunea vine din embedder)
+        self._expires = np.full(max_entries, -np.inf)
+        self._responses = [None] * max_entries  # ChatResponse
+        self._next = 0  # următorul rând suprascris (FIFO: cea mai veche intrare)
+        self._size = 0
+
+    @staticmethod
+    def _normalize(vec) -> np.ndarray:
+        arr = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(arr)
+        return arr / norm if norm else arr
+
+    def lookup(self, vec):
+        if not self._size:
+            return None
+        valid = self._expires[:self._size] > time.monotonic()
+        if not valid.any():
+            return None
+        scores = self._vectors[:self._size] @ self._normalize(vec)
+        scores[~valid] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            return self._responses[best]
+        return None
+
+    def clear(self):
+        self._expires[:] = -np.inf
+        self._responses = [None] * self.max_entries
+        self._next = 0
+        self._size = 0
+
+    def store(self, vec, response):
+        row = self._normalize(vec)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, row.shape[0]), dtype=np.float32)
+        i = self._next
+        self._vectors[i] = row
+        self._expires[i] = time.monotonic() + self.ttl_sec
+        self._responses[i] = response
+        self._next = (i + 1) % self.max_entries
+        self._size = min(self._size + 1, self.max_entries)
+
+def cache_key(question: str) -> str:
+    # lowercase + fără diacritice + spații comprimate: "Cât costă?" == "cat  costa?"
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"\s+", " ", text).strip()
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+async def embed_questions(questions: List[str]):
+    # Embedding-urile servesc doar cheilor din cache-ul semantic: dacă avem modelul local (CPU, ~ms),
+    # evităm round-trip-ul către Azure. Encode-ul e CPU-bound, deci rulează pe un thread.
+    if clients.embedder is not None:
+        return list(await asyncio.to_thread(clients.embedder.encode, questions, normalize_embeddings=True))
+
+    # Un singur apel API per lot (Azure acceptă până la 2048 de input-uri per cerere)
+    vectors = []
+    for i in range(0, len(questions), EMBED_BATCH_SIZE):
+        emb = await clients.embed.embeddings.create(
+            model=os.environ["AZURE_OPENAI_EMBED_DEPLOYMENT"],
+            input=questions[i:i + EMBED_BATCH_SIZE],
+        )
+        vectors.extend(item.embedding for item in emb.data)
+    return vectors
+
+async def embed_question(question: str):
+    return (await embed_questions([question]))[0]
+
+def semantic_cache_enabled() -> bool:
+    # L2 are nevoie de un embedder: modelul local sau deployment-ul Azure de embeddings
+    return clients.embedder is not None or clients.embed is not None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Inițializare PaaS/Serverless
-    clients["search"] = SearchClient(
+    clients.search = SearchClient(
         endpoint=os.environ["AZURE_SEARCH_ENDPOINT"],
         index_name=os.environ["AZURE_SEARCH_INDEX"],
         credential=AzureKeyCredential(os.environ["AZURE_SEARCH_ADMIN_KEY"]),
     )
-    clients["openai"] = AsyncAzureOpenAI(
+    clients.openai = AsyncAzureOpenAI(
         api_key=os.environ["AZURE_OPENAI_CHAT_KEY"],
         azure_endpoint=os.environ["AZURE_OPENAI_CHAT_ENDPOINT"],
         api_version="2024-12-01-preview",
     )
+    # Embedding-urile sunt opționale (doar pentru cache-ul L2): fără ele aplicația merge doar cu L1
+    if all(os.getenv(v) for v in ("AZURE_OPENAI_EMBED_API_KEY", "AZURE_OPENAI_EMBED_ENDPOINT", "AZURE_OPENAI_EMBED_DEPLOYMENT")):
+        clients.embed = AsyncAzureOpenAI(
+            api_key=os.environ["AZURE_OPENAI_EMBED_API_KEY"],
+            azure_endpoint=os.environ["AZURE_OPENAI_EMBED_ENDPOINT"],
+            api_version="2024-02-01",
+        )
+    if SEMANTIC_CACHE_LOCAL_MODEL:
+        if SentenceTransformer is None:
+            logger.warning("SEMANTIC_CACHE_LOCAL_MODEL setat, dar sentence-transformers nu e instalat; folosim Azure OpenAI")
+        else:
+            try:
+                clients.embedder = SentenceTransformer(SEMANTIC_CACHE_LOCAL_MODEL, backend="onnx")
+            except Exception as e:
+                # optimum/onnxruntime lipsă sau modelul nu s-a putut descărca: nu blocăm startup-ul
+                logger.warning(f"Modelul local {SEMANTIC_CACHE_LOCAL_MODEL} nu s-a încărcat ({e}); folosim Azure OpenAI")
+    if not semantic_cache_enabled():
+        logger.warning("Niciun embedder configurat (AZURE_OPENAI_EMBED_* / SEMANTIC_CACHE_LOCAL_MODEL): cache-ul semantic (L2) e dezactivat")
+    clients.l1_cache = TTLCache(maxsize=L1_CACHE_MAX_ENTRIES, ttl=L1_CACHE_TTL_SEC)
+    clients.semantic_cache = SemanticCache(
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        ttl_sec=SEMANTIC_CACHE_TTL_SEC,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+    )
     # String conexiune SQL (PaaS)
-    clients["sql_conn_str"] = (
+    sql_conn_str = (
         f"Driver={{ODBC Driver 18 for SQL Server}};"
         f"Server=tcp:{os.environ['SQL_SERVER']},1433;"
         f"Database={os.environ['SQL_DATABASE']};"
@@ -40,9 +200,42 @@ async def lifespan(app: FastAPI):
         f"Pwd={os.environ['SQL_PASSWORD']};"
         f"Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30;"
     )
+    # Pool de conexiuni: handshake-ul TLS + autentificarea se plătesc o singură dată, nu per request.
+    # minsize=0: conexiunile se deschid la cerere, deci o bază oprită (serverless) nu blochează startup-ul.
+    try:
+        clients.sql_pool = await aioodbc.create_pool(
+            dsn=sql_conn_str,
+            minsize=int(os.getenv("SQL_POOL_MIN", "0")),
+            maxsize=int(os.getenv("SQL_POOL_MAX", "20")),
+            timeout=30,
+        )
+    except Exception as e:
+        # SQL rămâne opțional: aplicația pornește, întrebările Search funcționează în continuare
+        logger.error(f"SQL pool error: {e}")
+        clients.sql_pool = None
+    if CACHE_ENABLED and CACHE_WARMUP_FILE:
+        # Rulează în fundal: aplicația pornește imediat, cache-ul se populează treptat
+        try:
+            with open(CACHE_WARMUP_FILE, encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()]
+        except OSError as e:
+            logger.error(f"Cache warmup: fișierul {CACHE_WARMUP_FILE} nu poate fi citit: {e}")
+        else:
+            clients.warmup_task = asyncio.create_task(warmup_cache(questions))
     yield
-    await clients["search"].close()
+    if clients.warmup_task:
+        clients.warmup_task.cancel()
+    # Clienții sunt singleton-uri pe durata aplicației; închidem pool-urile HTTP la shutdown
+    await clients.search.close()
+    await clients.openai.close()
+    if clients.embed is not None:
+        await clients.embed.close()
+    if clients.sql_pool is not None:
+        clients.sql_pool.close()
+        await clients.sql_pool.wait_closed()
 
+# Fără default_response_class: cu response_model, versiunile recente de FastAPI serializează ChatResponse direct prin
+# Pydantic (Rust) în bytes JSON; orjson rămâne doar pentru evenimentele SSE
 app = FastAPI(lifespan=lifespan)
 
 class ChatRequest(BaseModel):
@@ -58,139 +251,277 @@ class ChatResponse(BaseModel):
     execution_flow: str
     latency_ms: float
 
-def get_sql_data(question: str):
-    try:
-        with pyodbc.connect(clients["sql_conn_str"]) as conn:
-            cursor = conn.cursor()
-            q_lower = question.lower()
-            
-            # 1. Gestionare Ieftin/Scump (Agregări)
-            order = None
-            if any(word in q_lower for word in ["ieftin", "minim", "mic"]):
-                order = "ASC"
-            elif any(word in q_lower for word in ["scump", "maxim", "mare"]):
-                order = "DESC"
-            
-            if order:
-                cursor.execute(f"""
-                    SELECT TOP 1 a.attraction_name, t.price, t.currency, t.ticket_type
-                    FROM attractions a
-                    JOIN tickets t ON a.attraction_name = t.attraction_name
-                    ORDER BY t.price {order}
-                """)
-                row = cursor.fetchone()
-                if row:
-                    return f"Informație SQL: {row.attraction_name} are biletul {row.ticket_type} la prețul de {row.price} {row.currency}."
-
-            # 2. Curățare pentru potrivire nume (extragere search_term)
-            noise = ["care", "este", "pretul", "prețul", "orarul", "programul", "la", "pentru", "e", "vă rog", "spune-mi"]
-            search_term = q_lower
-            for w in noise:
-                search_term = search_term.replace(f" {w} ", " ").replace(f"{w} ", "")
-            search_term = search_term.replace("?", "").strip()
-
-            # 3. Potrivire bidirecțională
-            query = """
-                SELECT a.attraction_name, h.open_time, h.close_time, t.price, t.currency, t.ticket_type
-                FROM attractions a
-                LEFT JOIN opening_hours h ON a.attraction_name = h.attraction_name
-                LEFT JOIN tickets t ON a.attraction_name = t.attraction_name
-                WHERE ? LIKE '%' + a.attraction_name + '%' 
-                OR a.attraction_name LIKE ?
-            """
-            cursor.execute(query, (q_lower, f"%{search_term}%"))
-            rows = cursor.fetchall()
-            
-            if rows:
-                data = {}
-                for r in rows:
-                    if r.attraction_name not in data:
-                        data[r.attraction_name] = {"orar": f"{r.open_time}-{r.close_time}", "bilete": []}
-                    if r.price:
-                        data[r.attraction_name]["bilete"].append(f"{r.ticket_type}: {r.price} {r.currency}")
-                
-                res_parts = [f"{name} (Orar: {info['orar']}, Bilete: {', '.join(info['bilete'])})" for name, info in data.items()]
-                return "\n".join(res_parts)
-            return None
-    except Exception as e:
-        logger.error(f"SQL Error: {e}")
-        return None
+# Răspunsurile sunt construite server-side din date deja tipizate (index Search, SQL, LLM),
+# așa că folosim model_construct(): modelul e validat o singură dată, de response_model la ieșire.
+SQL_CITATION = Citation(source="Azure SQL Database", chunk_id=0)
+
+SEARCH_SELECT_FIELDS = ["source", "chunk_id", "content"]
+
+async def search_documents(question: str):
+    # Consumăm paginatorul aici, ca tot round-trip-ul Search să ruleze în task-ul din gather
+    # Cerem doar câmpurile folosite (fără contentVector/title) -> payload JSON mult mai mic
+    s_res = await clients.search.search(
+        search_text=question,
+        top=3,
+        select=SEARCH_SELECT_FIELDS,
+        include_total_count=False,
+    )
+    return [r async for r in s_res]
+
+def build_context(sql_info, search_docs) -> str:
+    # Colectăm bucățile brute și facem un singur join la final (fără f-string intermediar per document)
+    parts = []
+    if sql_info:
+        parts += ("DATE SQL:\n", sql_info)
+    for r in search_docs or ():
+        parts += (" " if parts else "", "DOCUMENTE: ", r["content"])
+    return "".join(parts)
+
+async def _noop():
+    return None
+
+async def _sql_ping():
+    async with clients.sql_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT 1")
 
 @app.get("/health")
 async def health_check():
     health_status = {"status": "online", "services": {"azure_search": "initialized", "azure_openai": "initialized", "azure_sql": "unknown"}}
     try:
-        with pyodbc.connect(clients["sql_conn_str"], timeout=5) as conn:
-            health_status["services"]["azure_sql"] = "connected"
+        # Timeout-ul acoperă și acquire(): un pool epuizat sau inaccesibil nu blochează /health
+        await asyncio.wait_for(_sql_ping(), timeout=5)
+        health_status["services"]["azure_sql"] = "connected"
     except Exception:
         health_status["services"]["azure_sql"] = "disconnected"
+    health_status["cache"] = dict(cache_stats)
     return health_status
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    start_time = time.perf_counter()
-    q_lower = request.question.lower()
-    contexts, citations, flow = [], [], []
-
-    # 1. SQL KEYWORDS (Date structurate: prețuri, orar, disponibilitate)
-# Include articulări (prețul, biletul) și plural (prețuri, bilete)
-    sql_k = [
-    "pret", "preț", "pretul", "prețul", "preturi", "prețuri", 
-    "bilet", "bilete", "biletul", "biletele", "biletului",
-    "costa", "costă", "euro", "ieftin", "ieftină", "scump", "scumpă",
-    "maxim", "minim", "mic", "mică", "mare",
-    "orar", "orarul", "program", "programul", "funcționare", "vizitare",
-    "deschis", "inchis", "închis", "cand", "când", "ora", "ore", "orele",
-    "luni", "marti", "marți", "miercuri", "joi", "vineri", "sambata", "sâmbătă", "sâmbăta", "duminica", "duminică",
-    "adult", "student", "copil", "copii", "senior", "gratuit", "gratis"
-]
-
-# 2. SEARCH KEYWORDS (Context nestructurat: reguli, sfaturi, siguranță, istorie)
-# Include termeni care forțează accesarea documentelor PDF/TXT
-    search_k = [
-    "reguli", "securitate", "vigoare", "safety", "sfat", "sfaturi", "tips", 
-    "recomand", "recomanda", "recomandări", "recomandari", "istorie", "detalii",
-    "acces", "intrare", "ghid", "transport", "transportul", "metrou", "bus", "autobuz",
-    "harta", "hartă", "validare", "validarea", "evita", "cozi", "cozile", 
-    "restricții", "restrictii", "călătorie", "calatorie", "cunoască", "cunoasca", 
-    "compară", "compara", "îmbarcare", "imbarcare", "vizitarea", "ploaie", "ploioasă"
-]
+@app.post("/cache/invalidate")
+async def invalidate_cache(x_admin_key: Optional[str] = Header(default=None)):
+    # Golește cache-urile după actualizarea datelor (prețuri/orar în SQL, documente în Search).
+    # Cache-urile sunt per proces: cu mai mulți workeri (WEB_CONCURRENCY > 1) se golește doar
+    # worker-ul care primește cererea, de aceea startup.sh pornește implicit un singur worker.
+    admin_key = os.getenv("ADMIN_KEY")
+    if not admin_key or not hmac.compare_digest((x_admin_key or "").encode(), admin_key.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    cleared = {"sql": len(SQL_CACHE), "l1": len(clients.l1_cache)}
+    SQL_CACHE.clear()
+    clients.l1_cache.clear()
+    clients.semantic_cache.clear()
+    return {"status": "ok", "scope": "process", "pid": os.getpid(), "cleared": cleared}
 
-    # 1. Detecție SQL (PaaS)
-    is_sql_query = any(k in q_lower for k in sql_k)
-    sql_info = None
-    if is_sql_query:
-        sql_info = get_sql_data(request.question)
-        if sql_info:
-            contexts.append(f"DATE SQL:\n{sql_info}")
-            citations.append(Citation(source="Azure SQL Database", chunk_id=0))
-            flow.append("SQL")
-
-    # 2. Verificare Search (Dacă e nevoie de detalii sau SQL nu a găsit nimic)
-    needs_search = any(k in q_lower for k in search_k)
-    if needs_search or not contexts:
-        s_res = await clients["search"].search(search_text=request.question, top=3)
-        async for r in s_res:
-            contexts.append(f"DOCUMENTE: {r['content']}")
-            citations.append(Citation(source=r['source'], chunk_id=r['chunk_id']))
+SYSTEM_PROMPT = "Ești un asistent de turism pentru Paris. Combină datele SQL (prețuri/orar) cu informațiile din documente. Prioritizează SQL pentru cifre."
+
+async def cache_lookup(question: str):
+    # Cache L1 (exact) apoi L2 (semantic); un hit L2 populează și L1
+    key = cache_key(question)
+    cached = clients.l1_cache.get(key)
+    if cached:
+        cache_stats["l1_hits"] += 1
+        return key, None, cached, "CACHE L1"
+
+    embedding = None
+    if semantic_cache_enabled():
+        # Cache-ul e o optimizare: dacă embedding-ul eșuează, răspundem pe calea normală (fără L2)
+        try:
+            embedding = await embed_question(question)
+            cached = clients.semantic_cache.lookup(embedding)
+        except Exception as e:
+            logger.error(f"Semantic cache error: {e}")
+            embedding, cached = None, None
+        if cached:
+            cache_stats["l2_hits"] += 1
+            clients.l1_cache[key] = cached
+            return key, embedding, cached, "CACHE L2"
+    cache_stats["misses"] += 1
+    return key, embedding, None, None
+
+def cache_store(key: str, embedding, response: ChatResponse):
+    clients.l1_cache[key] = response
+    if embedding is not None:
+        clients.semantic_cache.store(embedding, response)
+
+async def retrieve_context(question: str, q_lower: str, is_sql_query: bool):
+    citations, flow = [], []
+
+    # 2. SQL și Search rulează concurent (latența devine max(sql, search), nu suma lor).
+    needs_search = bool(SEARCH_RE.search(q_lower))
+    sql_task = get_sql_data(clients.sql_pool, question) if is_sql_query else _noop()
+    search_task = search_documents(question) if (needs_search or not is_sql_query) else _noop()
+    sql_info, search_docs = await asyncio.gather(sql_task, search_task)
+
+    if sql_info:
+        citations.append(SQL_CITATION)
+        flow.append("SQL")
+
+    # Fallback: SQL nu a găsit nimic și Search nu a fost pornit
+    if search_docs is None and not sql_info:
+        search_docs = await search_documents(question)
+    if search_docs is not None:
+        for r in search_docs:
+            citations.append(Citation.model_construct(source=r['source'], chunk_id=r['chunk_id']))
         flow.append("SEARCH")
 
-    # 3. Generare Răspuns LLM
+    # Fast path: întrebare strict structurată (preț/orar) la care SQL a răspuns complet -> fără LLM
+    if sql_info and search_docs is None and STRUCTURED_RE.match(q_lower):
+        return None, citations, "SQL", sql_info
+
+    context = build_context(sql_info, search_docs)
     final_flow = " + ".join(list(dict.fromkeys(flow))) + " + LLM"
-    
-    response = await clients["openai"].chat.completions.create(
+    return context, citations, final_flow, None
+
+def build_messages(question: str, context: str):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Context:\n{context}\n\nÎntrebare: {question}"}
+    ]
+
+async def generate_answer(question: str, q_lower: str, is_sql_query: bool, start_time: float) -> ChatResponse:
+    context, citations, final_flow, direct_answer = await retrieve_context(question, q_lower, is_sql_query)
+    if direct_answer:
+        latency = (time.perf_counter() - start_time) * 1000
+        return ChatResponse.model_construct(
+            answer=direct_answer,
+            citations=citations,
+            execution_flow=final_flow,
+            latency_ms=round(latency, 2)
+        )
+
+    # 3. Generare Răspuns LLM
+    response = await clients.openai.chat.completions.create(
         model=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT"],
-        messages=[
-            {"role": "system", "content": "Ești un asistent de turism pentru Paris. Combină datele SQL (prețuri/orar) cu informațiile din documente. Prioritizează SQL pentru cifre."},
-            {"role": "user", "content": f"Context:\n{' '.join(contexts)}\n\nÎntrebare: {request.question}"}
-        ],
-        temperature=0.2
+        messages=build_messages(question, context),
+        **LLM_OPTIONS
     )
 
+    # content=None (ex. filtrul de conținut Azure): model_construct nu validează, deci verificăm explicit
+    answer = response.choices[0].message.content
+    if answer is None:
+        logger.warning(f"LLM fără conținut (finish_reason={response.choices[0].finish_reason})")
+        raise HTTPException(status_code=502, detail="Modelul nu a returnat un răspuns")
+
     latency = (time.perf_counter() - start_time) * 1000
-    return ChatResponse(
-        answer=response.choices[0].message.content,
+    return ChatResponse.model_construct(
+        answer=answer,
         citations=citations,
         execution_flow=final_flow,
         latency_ms=round(latency, 2)
     )
+
+async def warmup_cache(questions: List[str]):
+    # Embedding-urile se calculează în loturi (un apel API în loc de N); întrebările SQL nu se cache-uiesc
+    questions = [q for q in dict.fromkeys(questions) if not SQL_RE.search(q.lower())]
+    if not questions:
+        return
+    # Fără embedder încălzim doar L1
+    embeddings = [None] * len(questions)
+    if semantic_cache_enabled():
+        try:
+            embeddings = await embed_questions(questions)
+        except Exception as e:
+            logger.error(f"Cache warmup error: {e}")
+            return
+    warmed = 0
+    for question, embedding in zip(questions, embeddings):
+        if embedding is not None and clients.semantic_cache.lookup(embedding):
+            continue
+        # O întrebare care eșuează nu oprește încălzirea celorlalte
+        try:
+            result = await generate_answer(question, question.lower(), False, time.perf_counter())
+        except Exception as e:
+            logger.error(f"Cache warmup error ({question!r}): {e}")
+            continue
+        cache_store(cache_key(question), embedding, result)
+        warmed += 1
+    logger.info(f"Cache warmup: {warmed}/{len(questions)} întrebări adăugate")
+
+def sse_event(payload: dict) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    start_time = time.perf_counter()
+    q_lower = request.question.lower()
+
+    # 1. Detecție SQL (PaaS)
+    is_sql_query = bool(SQL_RE.search(q_lower))
+
+    # Cache: prețurile/orarul (SQL) sunt date live, nu le servim din cache
+    use_cache = CACHE_ENABLED and not is_sql_query
+    if use_cache:
+        key, embedding, cached, cache_flow = await cache_lookup(request.question)
+        if cached:
+            latency = (time.perf_counter() - start_time) * 1000
+            return cached.model_copy(update={"execution_flow": cache_flow, "latency_ms": round(latency, 2)})
+
+    result = await generate_answer(request.question, q_lower, is_sql_query, start_time)
+    if use_cache:
+        cache_store(key, embedding, result)
+    return result
+
+async def sse_replay(answer: str, citations, flow: str, start_time: float):
+    # Răspuns deja complet (cache sau SQL): un singur delta + evenimentul final
+    yield sse_event({"delta": answer})
+    latency = (time.perf_counter() - start_time) * 1000
+    yield sse_event({
+        "citations": [c.model_dump() for c in citations],
+        "execution_flow": flow,
+        "latency_ms": round(latency, 2),
+    })
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    # Aceeași rutare ca /chat, dar tokenii ajung la client pe măsură ce sunt generați (SSE):
+    # evenimente {"delta": ...}, apoi un eveniment final cu citările, flow-ul și latența.
+    start_time = time.perf_counter()
+    q_lower = request.question.lower()
+    is_sql_query = bool(SQL_RE.search(q_lower))
+
+    use_cache = CACHE_ENABLED and not is_sql_query
+    if use_cache:
+        key, embedding, cached, cache_flow = await cache_lookup(request.question)
+        if cached:
+            return StreamingResponse(
+                sse_replay(cached.answer, cached.citations, cache_flow, start_time),
+                media_type="text/event-stream",
+            )
+
+    context, citations, final_flow, direct_answer = await retrieve_context(request.question, q_lower, is_sql_query)
+    if direct_answer:
+        return StreamingResponse(
+            sse_replay(direct_answer, citations, final_flow, start_time),
+            media_type="text/event-stream",
+        )
+    stream = await clients.openai.chat.completions.create(
+        model=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT"],
+        messages=build_messages(request.question, context),
+        stream=True,
+        **LLM_OPTIONS
+    )
+
+    async def generate():
+        parts = []  # textul complet e necesar doar pentru scrierea în cache
+        # async with: dacă clientul se deconectează, răspunsul HTTP upstream se închide imediat, nu la GC
+        async with stream:
+            async for chunk in stream:
+                # Azure trimite și chunk-uri fără choices (rezultatele filtrelor de conținut)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield sse_event({"delta": chunk.choices[0].delta.content})
+
+        latency = (time.perf_counter() - start_time) * 1000
+        if use_cache:
+            cache_store(key, embedding, ChatResponse.model_construct(
+                answer="".join(parts),
+                citations=citations,
+                execution_flow=final_flow,
+                latency_ms=round(latency, 2)
+            ))
+        yield sse_event({
+            "citations": [c.model_dump() for c in citations],
+            "execution_flow": final_flow,
+            "latency_ms": round(latency, 2),
+        })
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
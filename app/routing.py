@@ -0,0 +1,170 @@
+import os
+import re
+import logging
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Prețurile și orarul se schimbă rar: rezultatele SQL sunt ținute în memorie, cheie = (agregare, search_term)
+SQL_CACHE = TTLCache(
+    maxsize=int(os.getenv("SQL_CACHE_MAX_ENTRIES", "1000")),
+    ttl=int(os.getenv("SQL_CACHE_TTL_SEC", "3600")),
+)
+
+# 1. SQL KEYWORDS (Date structurate: prețuri, orar, disponibilitate)
+# Include articulări (prețul, biletul) și plural (prețuri, bilete)
+SQL_KEYWORDS: frozenset = frozenset({
+    "pret", "preț", "pretul", "prețul", "preturi", "prețuri", 
+    "bilet", "bilete", "biletul", "biletele", "biletului",
+    "costa", "costă", "euro", "ieftin", "ieftină", "scump", "scumpă",
+    "maxim", "minim", "mic", "mică", "mare",
+    "orar", "orarul", "program", "programul", "funcționare", "vizitare",
+    "deschis", "inchis", "închis", "cand", "când", "ora", "ore", "orele",
+    "luni", "marti", "marți", "miercuri", "joi", "vineri", "sambata", "sâmbătă", "sâmbăta", "duminica", "duminică",
+    "adult", "student", "copil", "copii", "senior", "gratuit", "gratis"
+})
+
+# 2. SEARCH KEYWORDS (Context nestructurat: reguli, sfaturi, siguranță, istorie)
+# Include termeni care forțează accesarea documentelor PDF/TXT
+SEARCH_KEYWORDS: frozenset = frozenset({
+    "reguli", "securitate", "vigoare", "safety", "sfat", "sfaturi", "tips", 
+    "recomand", "recomanda", "recomandări", "recomandari", "istorie", "detalii",
+    "acces", "intrare", "ghid", "transport", "transportul", "metrou", "bus", "autobuz",
+    "harta", "hartă", "validare", "validarea", "evita", "cozi", "cozile", 
+    "restricții", "restrictii", "călătorie", "calatorie", "cunoască", "cunoasca", 
+    "compară", "compara", "îmbarcare", "imbarcare", "vizitarea", "ploaie", "ploioasă"
+})
+
+# Agregări în get_sql_data: "cel mai ieftin" / "cel mai scump"
+CHEAP_WORDS: frozenset = frozenset({"ieftin", "minim", "mic"})
+EXPENSIVE_WORDS: frozenset = frozenset({"scump", "maxim", "mare"})
+
+def _alternation(words) -> str:
+    # Ordine deterministă (seturile nu au ordine), cele mai lungi primele
+    return "|".join(re.escape(w) for w in sorted(words, key=lambda w: (-len(w), w)))
+
+def _keyword_pattern(keywords):
+    # Un singur regex compilat = o singură scanare în motorul C, în loc de un `in` per cuvânt.
+    # Fără \b: păstrăm potrivirea pe subșir ("prețurile" conține "preț").
+    return re.compile(_alternation(keywords))
+
+SQL_RE = _keyword_pattern(SQL_KEYWORDS)
+SEARCH_RE = _keyword_pattern(SEARCH_KEYWORDS)
+CHEAP_RE = _keyword_pattern(CHEAP_WORDS)
+EXPENSIVE_RE = _keyword_pattern(EXPENSIVE_WORDS)
+
+# Întrebări strict structurate ("Cât costă...", "Care este programul...", "Care sunt orele...")
+# la care răspunsul SQL e complet și poate fi returnat direct, fără LLM
+STRUCTURED_RE = re.compile(r"^\s*(?:cât|cat|care|ce)\s+(?:(?:este|e|sunt)\s+)?(?:cost|pre[tț]|or|program)")
+
+# Cuvinte de umplutură eliminate la extragerea numelui atracției.
+# Aici folosim \b: se elimină doar cuvinte întregi ("e" nu mai taie finalul lui "louvre").
+NOISE_WORDS: frozenset = frozenset({"care", "este", "pretul", "prețul", "orarul", "programul", "la", "pentru", "e", "vă rog", "spune-mi"})
+NOISE_RE = re.compile(r"\b(?:" + _alternation(NOISE_WORDS) + r")\b")
+
+# Zilele săptămânii: cuvântul din întrebare (cu/fără diacritice, articulat) -> valoarea din opening_hours.day_of_week
+DAYS = (
+    ("Monday", "luni", r"luni"),
+    ("Tuesday", "marți", r"mar[tț]i"),
+    ("Wednesday", "miercuri", r"miercuri"),
+    ("Thursday", "joi", r"joi"),
+    ("Friday", "vineri", r"vineri"),
+    ("Saturday", "sâmbătă", r"s[âa]mb[ăa]t"),
+    ("Sunday", "duminică", r"duminic"),
+)
+DAY_LABELS = {day: label for day, label, _ in DAYS}
+DAY_ORDER = {day: i for i, (day, _, _) in enumerate(DAYS)}
+DAY_RE = re.compile(r"\b(?:" + "|".join(f"(?P<{day}>{pattern})" for day, _, pattern in DAYS) + ")")
+
+def requested_day(q_lower: str):
+    m = DAY_RE.search(q_lower)
+    return m.lastgroup if m else None
+
+async def _sql_fetch(pool, query: str, params=(), one: bool = False):
+    # Fiecare interogare își ia propria conexiune din pool, ca să poată rula în paralel
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, params)
+            return await (cursor.fetchone() if one else cursor.fetchall())
+
+async def _query_by_price(pool, order: str):
+    row = await _sql_fetch(pool, f"""
+        SELECT TOP 1 a.attraction_name, t.price, t.currency, t.ticket_type
+        FROM attractions a
+        JOIN tickets t ON a.attraction_name = t.attraction_name
+        ORDER BY t.price {order}
+    """, one=True)
+    if row:
+        return f"Informație SQL: {row.attraction_name} are biletul {row.ticket_type} la prețul de {row.price} {row.currency}."
+    return None
+
+def extract_search_term(q_lower: str) -> str:
+    # 2. Curățare pentru potrivire nume (extragere search_term)
+    return " ".join(NOISE_RE.sub(" ", q_lower).replace("?", "").split())
+
+async def _query_by_name(pool, q_lower: str, search_term: str):
+    # 3. Potrivire bidirecțională (join-ul e pre-materializat în vw_attraction_full, vezi sql/)
+    query = """
+        SELECT attraction_name, day_of_week, open_time, close_time, is_closed, price, currency, ticket_type
+        FROM dbo.vw_attraction_full WITH (NOEXPAND)
+        WHERE ? LIKE '%' + attraction_name + '%' 
+        OR attraction_name LIKE ?
+    """
+    rows = await _sql_fetch(pool, query, (q_lower, f"%{search_term}%"))
+
+    if rows:
+        # View-ul are un rând per (zi, bilet): orarul se grupează pe zi, biletele se de-duplică
+        day = requested_day(q_lower)
+        data = {}
+        for r in rows:
+            info = data.setdefault(r.attraction_name, {"orar": {}, "bilete": {}})
+            info["orar"][r.day_of_week] = "închis" if r.is_closed else f"{r.open_time}-{r.close_time}"
+            if r.price:
+                info["bilete"][r.ticket_type] = f"{r.ticket_type}: {r.price} {r.currency}"
+
+        res_parts = []
+        for name, info in data.items():
+            if day in info["orar"]:
+                orar = f"Orar {DAY_LABELS[day]}: {info['orar'][day]}"
+            else:
+                days = sorted(info["orar"], key=lambda d: DAY_ORDER.get(d, len(DAY_ORDER)))
+                orar = "Orar: " + "; ".join(f"{DAY_LABELS.get(d, d)} {info['orar'][d]}" for d in days)
+            res_parts.append(f"{name} ({orar}, Bilete: {', '.join(info['bilete'].values())})")
+        return "\n".join(res_parts)
+    return None
+
+async def _lookup(pool, q_lower: str, search_term: str, order):
+    # Agregarea (TOP 1 fără filtru) întoarce un rând de îndată ce există bilete, deci potrivirea
+    # pe nume rulează doar ca fallback, când tabela e goală: o singură conexiune din pool per cerere.
+    if order:
+        by_price = await _query_by_price(pool, order)
+        if by_price:
+            return by_price
+    return await _query_by_name(pool, q_lower, search_term)
+
+async def get_sql_data(pool, question: str):
+    if pool is None:
+        # Pool-ul nu a putut fi creat la startup: SQL e indisponibil, răspundem doar din Search
+        return None
+    q_lower = question.lower()
+
+    # 1. Gestionare Ieftin/Scump (Agregări)
+    order = None
+    if CHEAP_RE.search(q_lower):
+        order = "ASC"
+    elif EXPENSIVE_RE.search(q_lower):
+        order = "DESC"
+
+    search_term = extract_search_term(q_lower)
+    key = (order, search_term)
+    if key in SQL_CACHE:
+        return SQL_CACHE[key]
+
+    try:
+        result = await _lookup(pool, q_lower, search_term, order)
+    except Exception as e:
+        # Erorile nu se cache-uiesc: următorul request reîncearcă SQL
+        logger.error(f"SQL Error: {e}")
+        return None
+    SQL_CACHE[key] = result
+    return result
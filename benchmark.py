@@ -2,20 +2,44 @@ import csv
 import json
 import os
 import time
-import statistics
-from collections import defaultdict
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 import requests
+try:
+    import orjson  # parsare/serializare JSON în C, UTF-8 nativ
+except ImportError:
+    orjson = None
+from requests.adapters import HTTPAdapter
 
 # Configurații din variabile de mediu sau default
 API_URL = os.getenv(
     "API_URL",
     "https://webapp-rag-dtchdma6f5cnesb6.francecentral-01.azurewebsites.net/chat",
 )
+# Warmup pe /health: încălzește TLS, cold start-ul și pool-ul SQL fără să populeze cache-ul de răspunsuri
+HEALTH_URL = os.getenv("HEALTH_URL", API_URL.rsplit("/", 1)[0] + "/health")
 RUNS_PER_QUESTION = int(os.getenv("RUNS_PER_QUESTION", "2"))
+WARMUP_RUNS = int(os.getenv("WARMUP_RUNS", "1"))
 TIMEOUT_SEC = int(os.getenv("TIMEOUT_SEC", "60"))
 PLOT = os.getenv("PLOT", "1") == "1"
+CONCURRENCY = int(os.getenv("CONCURRENCY", "8"))
+CB_THRESHOLD = int(os.getenv("CB_THRESHOLD", "5"))
+CB_SLEEP_SEC = float(os.getenv("CB_SLEEP_SEC", "10"))
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
+RETRY_BASE_SEC = 0.1
+RETRY_CAP_SEC = 2.0
+RETRY_STATUSES = {502, 503, 504}
+
+CSV_FIELDS = ["question", "run", "http_status", "execution_flow", "server_latency_ms", "client_latency_ms", "attempts", "answer"]
+
+# O singură sesiune: conexiunile TCP + TLS sunt refolosite între cereri (keep-alive)
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=CONCURRENCY, pool_maxsize=CONCURRENCY)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
 
 QUESTIONS = [
     # --- CATEGORIA 1: SQL-ONLY (Date structurate din tabelele tale) ---
@@ -51,38 +75,40 @@ QUESTIONS = [
     "Cât costă accesul la Turnul Eiffel pentru copii?"
 ]
 
-def pct(values, p):
-    if not values: return None
-    values = sorted(values)
-    k = int((p / 100) * (len(values) - 1))
-    return values[k]
-
-def safe_float(x):
-    try: return float(x)
-    except: return None
-
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
-def compute_flow_stats(rows):
-    by_flow = defaultdict(list)
-    for row in rows:
-        flow = row.get("execution_flow") or "UNKNOWN"
-        ms = safe_float(row.get("server_latency_ms"))
-        if ms is not None:
-            by_flow[flow].append(ms)
-
-    stats = {}
-    for flow, vals in by_flow.items():
-        if not vals: continue
-        stats[flow] = {
-            "n": len(vals),
-            "mean_ms": statistics.mean(vals),
-            "p50_ms": pct(vals, 50),
-            "p95_ms": pct(vals, 95),
-            "max_ms": max(vals),
+def compute_flow_stats(csv_path: Path):
+    # Conversie, grupare și agregare vectorizate (pandas/numpy), fără buclă Python per rând.
+    # Import local, ca matplotlib în plot_stats: dependență doar a benchmark-ului, nu a aplicației
+    try:
+        import pandas as pd
+    except ImportError as e:
+        raise SystemExit(f"[stats] pandas e necesar pentru statistici (pip install pandas): {e}. Rezultatele brute sunt în {csv_path}")
+    df = pd.read_csv(csv_path, usecols=["execution_flow", "server_latency_ms"])
+    df["server_latency_ms"] = pd.to_numeric(df["server_latency_ms"], errors="coerce")
+    df["execution_flow"] = df["execution_flow"].fillna("UNKNOWN")
+    df = df.dropna(subset=["server_latency_ms"])
+    if df.empty:
+        return {}, {}
+
+    g = df.groupby("execution_flow")["server_latency_ms"]
+    agg = g.agg(n="count", mean_ms="mean", max_ms="max")
+    # "lower" = rangul inferior, aceeași definiție de percentilă ca până acum
+    q = g.quantile([0.5, 0.95], interpolation="lower").unstack()
+
+    stats = {
+        flow: {
+            "n": int(row.n),
+            "mean_ms": float(row.mean_ms),
+            "p50_ms": float(q.at[flow, 0.5]),
+            "p95_ms": float(q.at[flow, 0.95]),
+            "max_ms": float(row.max_ms),
         }
-    return stats
+        for flow, row in agg.iterrows()
+    }
+    by_flow_vals = {flow: vals.to_numpy() for flow, vals in g}
+    return stats, by_flow_vals
 
 def write_flow_summary(stats: dict, out_csv: Path, out_json: Path):
     with out_csv.open("w", newline="", encoding="utf-8") as f:
@@ -92,13 +118,17 @@ def write_flow_summary(stats: dict, out_csv: Path, out_json: Path):
             w.writerow([flow, s["n"], round(s["mean_ms"], 2), round(s["p50_ms"], 2), round(s["p95_ms"], 2), round(s["max_ms"], 2)])
     
     payload = {"generated_at": datetime.utcnow().isoformat() + "Z", "stats_by_flow": stats}
-    out_json.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+    if orjson is not None:
+        out_json.write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+    else:
+        out_json.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
 
-def plot_stats(stats: dict, rows, out_dir: Path):
+def plot_stats(stats: dict, by_flow_vals: dict, out_dir: Path):
+    # API-ul OO (Figure + FigureCanvasAgg), fără starea globală pyplot: figurile sunt independente
+    # și pot fi randate în paralel (encodarea PNG eliberează GIL-ul)
     try:
-        import matplotlib
-        matplotlib.use("Agg") 
-        import matplotlib.pyplot as plt
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
     except Exception as e:
         print(f"[plot] Matplotlib indisponibil: {e}")
         return
@@ -110,90 +140,183 @@ def plot_stats(stats: dict, rows, out_dir: Path):
     p95s = [stats[f]["p95_ms"] for f in flows]
 
     # Grafic 1: Bar Chart p50 vs p95
-    fig = plt.figure(figsize=(12, 6))
+    bar_fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(bar_fig)
+    ax = bar_fig.subplots()
     x = range(len(flows))
     width = 0.35
-    plt.bar([i - width/2 for i in x], p50s, width=width, label="Mediana (p50)")
-    plt.bar([i + width/2 for i in x], p95s, width=width, label="Worst-case (p95)")
-    plt.xticks(list(x), flows, rotation=25, ha="right")
-    plt.ylabel("Latență Server (ms)")
-    plt.title("Performanță per Flow de Execuție (p50 vs p95)")
-    plt.legend()
-    plt.tight_layout()
-    fig.savefig(out_dir / "latency_by_flow_p50_p95.png", dpi=160)
-    plt.close(fig)
-
-    # Grafic 2: Boxplot (Distribuție)
-    by_flow_vals = defaultdict(list)
-    for row in rows:
-        flow = row.get("execution_flow") or "UNKNOWN"
-        ms = safe_float(row.get("server_latency_ms"))
-        if ms is not None: by_flow_vals[flow].append(ms)
+    ax.bar([i - width/2 for i in x], p50s, width=width, label="Mediana (p50)")
+    ax.bar([i + width/2 for i in x], p95s, width=width, label="Worst-case (p95)")
+    ax.set_xticks(list(x))
+    ax.set_xticklabels(flows, rotation=25, ha="right")
+    ax.set_ylabel("Latență Server (ms)")
+    ax.set_title("Performanță per Flow de Execuție (p50 vs p95)")
+    ax.legend()
+    bar_fig.tight_layout()
 
+    # Grafic 2: Boxplot (Distribuție) - refolosim array-urile din compute_flow_stats
     data = [by_flow_vals[f] for f in flows]
-    fig = plt.figure(figsize=(12, 6))
-    plt.boxplot(data, labels=flows, showfliers=True)
-    plt.xticks(rotation=25, ha="right")
-    plt.ylabel("Latență Server (ms)")
-    plt.title("Distribuția Latenței per Flow (Boxplot)")
-    plt.tight_layout()
-    fig.savefig(out_dir / "latency_boxplot.png", dpi=160)
-    plt.close(fig)
+    box_fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(box_fig)
+    ax = box_fig.subplots()
+    ax.boxplot(data, showfliers=True)
+    # etichetele prin set_xticklabels: `labels=` din boxplot a fost redenumit în matplotlib 3.9
+    ax.set_xticks(range(1, len(flows) + 1))
+    ax.set_xticklabels(flows, rotation=25, ha="right")
+    ax.set_ylabel("Latență Server (ms)")
+    ax.set_title("Distribuția Latenței per Flow (Boxplot)")
+    box_fig.tight_layout()
 
-def main():
-    out_rows = []
-    failures = 0
-    total = len(QUESTIONS) * RUNS_PER_QUESTION
-    done = 0
+    jobs = [
+        (bar_fig, out_dir / "latency_by_flow_p50_p95.png"),
+        (box_fig, out_dir / "latency_boxplot.png"),
+    ]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        list(pool.map(lambda job: job[0].savefig(job[1], dpi=160), jobs))
 
-    print(f"Benchmark start: {total} cereri către {API_URL}")
+class CircuitBreaker:
+    # closed -> open după `threshold` eșecuri consecutive; după `sleep_window` secunde trece în
+    # half-open și lasă o singură cerere de probă: succes -> closed, eșec -> open din nou.
+    def __init__(self, threshold: int, sleep_window: float):
+        self.threshold = threshold
+        self.sleep_window = sleep_window
+        self.state = "closed"
+        self.fail_count = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
 
-    for q in QUESTIONS:
-        for i in range(RUNS_PER_QUESTION):
-            t0 = time.perf_counter()
-            try:
-                done += 1
-                r = requests.post(API_URL, json={"question": q}, timeout=TIMEOUT_SEC)
-                client_ms = (time.perf_counter() - t0) * 1000
+    def before(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.sleep_window:
+                self.state = "half-open"
+                return True
+            return False  # open, sau half-open cu proba deja în curs
 
-                if r.status_code != 200:
-                    failures += 1
-                    out_rows.append({"question": q, "run": i+1, "status": r.status_code, "client_ms": client_ms, "execution_flow": "ERROR", "server_ms": 0, "answer": "HTTP Error"})
-                    continue
+    def on_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.fail_count = 0
+
+    def on_failure(self):
+        with self._lock:
+            self.fail_count += 1
+            if self.state == "half-open" or self.fail_count >= self.threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+BREAKER = CircuitBreaker(threshold=CB_THRESHOLD, sleep_window=CB_SLEEP_SEC)
+
+# Corpul fiecărei cereri e serializat o singură dată per întrebare, nu la fiecare rulare
+PAYLOADS = {
+    q: orjson.dumps({"question": q}) if orjson is not None else json.dumps({"question": q}).encode("utf-8")
+    for q in QUESTIONS
+}
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+def _post_with_retry(q: str):
+    # Reîncercări limitate cu backoff exponențial + full jitter, doar pentru erori tranzitorii;
+    # latența raportată e cea a ultimei încercări
+    for attempt in range(MAX_RETRIES + 1):
+        t0 = time.perf_counter()
+        try:
+            r = SESSION.post(API_URL, data=PAYLOADS[q], headers=JSON_HEADERS, timeout=TIMEOUT_SEC)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+        else:
+            if r.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return r, (time.perf_counter() - t0) * 1000, attempt + 1
+        time.sleep(random.uniform(0, min(RETRY_CAP_SEC, RETRY_BASE_SEC * 2 ** attempt)))
+
+def _do_one(q: str, i: int):
+    # Serviciul pică: nu mai așteptăm TIMEOUT_SEC per cerere, înregistrăm eșecul imediat
+    if not BREAKER.before():
+        return {"question": q, "run": i + 1, "http_status": "", "execution_flow": "CIRCUIT_OPEN", "server_latency_ms": "", "client_latency_ms": "", "attempts": 0, "answer": "Circuit deschis"}, False
 
-                data = r.json()
-                flow = data.get("execution_flow", "UNKNOWN")
-                server_ms = data.get("latency_ms", 0)
-                answer = data.get("answer", "")
-
-                print(f"[{done}/{total}] {flow} | Server: {server_ms}ms")
-
-                out_rows.append({
-                    "question": q,
-                    "run": i + 1,
-                    "http_status": r.status_code,
-                    "execution_flow": flow,
-                    "server_latency_ms": server_ms,
-                    "client_latency_ms": round(client_ms, 2),
-                    "answer": answer
-                })
-            except Exception as e:
-                failures += 1
-                print(f" Eroare: {e}")
+    try:
+        r, client_ms, attempts = _post_with_retry(q)
+    except requests.exceptions.RequestException as e:
+        BREAKER.on_failure()
+        print(f" Eroare: {e}")
+        return None, False
+
+    # Doar 5xx indică un serviciu cu probleme; 4xx e o eroare a cererii
+    if r.status_code >= 500:
+        BREAKER.on_failure()
+    else:
+        BREAKER.on_success()
+
+    try:
+        if r.status_code != 200:
+            return {"question": q, "run": i + 1, "http_status": r.status_code, "execution_flow": "ERROR", "server_latency_ms": "", "client_latency_ms": round(client_ms, 2), "attempts": attempts, "answer": "HTTP Error"}, False
+
+        data = orjson.loads(r.content) if orjson is not None else r.json()
+        return {
+            "question": q,
+            "run": i + 1,
+            "http_status": r.status_code,
+            "execution_flow": data.get("execution_flow", "UNKNOWN"),
+            "server_latency_ms": data.get("latency_ms", 0),
+            "client_latency_ms": round(client_ms, 2),
+            "attempts": attempts,
+            "answer": data.get("answer", "")
+        }, True
+    except Exception as e:
+        print(f" Eroare: {e}")
+        return None, False
+
+def _warmup_one(_):
+    try:
+        r = SESSION.get(HEALTH_URL, timeout=TIMEOUT_SEC)
+        return r.status_code
+    except requests.exceptions.RequestException as e:
+        print(f" Eroare warmup: {e}")
+        return None
+
+def main():
+    failures = 0
+    tasks = [(q, i) for q in QUESTIONS for i in range(RUNS_PER_QUESTION)]
+    total = len(tasks)
+    done = 0
 
+    print(f"Benchmark start: {total} cereri către {API_URL} (concurență: {CONCURRENCY})")
+
+    # Fiecare rând ajunge pe disc imediat: memorie constantă și rezultate parțiale dacă procesul e oprit
     csv_path = Path("performance_results.csv")
     with csv_path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["question", "run", "http_status", "execution_flow", "server_latency_ms", "client_latency_ms", "answer"])
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
         writer.writeheader()
-        writer.writerows(out_rows)
 
-    stats = compute_flow_stats(out_rows)
+        # Cererile sunt pur I/O: le suprapunem pe thread-uri (CONCURRENCY=1 -> măsurare secvențială)
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+            # Warmup-ul (câte o cerere /health per conexiune) se termină înainte de măsurători și nu
+            # trece prin /chat: altfel cache-ul L1 ar transforma rulările măsurate în "CACHE L1"
+            if WARMUP_RUNS:
+                statuses = list(pool.map(_warmup_one, range(WARMUP_RUNS * CONCURRENCY)))
+                print(f"Warmup: {sum(s == 200 for s in statuses)}/{len(statuses)} cereri /health reușite")
+
+            futures = [pool.submit(_do_one, q, i) for q, i in tasks]
+            for fut in as_completed(futures):
+                row, ok = fut.result()
+                done += 1
+                if not ok:
+                    failures += 1
+                if row is None:
+                    continue
+                writer.writerow(row)
+                f.flush()
+                if ok:
+                    print(f"[{done}/{total}] {row['execution_flow']} | Server: {row['server_latency_ms']}ms")
+
+    stats, by_flow_vals = compute_flow_stats(csv_path)
     out_dir = Path("plots")
     ensure_dir(out_dir)
     write_flow_summary(stats, out_dir / "flow_summary.csv", out_dir / "flow_summary.json")
     
     if PLOT:
-        plot_stats(stats, out_rows, out_dir)
+        plot_stats(stats, by_flow_vals, out_dir)
         print(f"\nBenchmark finalizat. Graficele sunt în /{out_dir}")
 
 if __name__ == "__main__":
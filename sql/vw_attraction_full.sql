@@ -0,0 +1,28 @@
+-- View materializată pentru lookup-ul din get_sql_data (app/routing.py):
+-- join-ul attractions ⨝ opening_hours ⨝ tickets se calculează la scriere, nu la fiecare request.
+-- Indexed views acceptă doar INNER JOIN: fiecare atracție trebuie să aibă cel puțin
+-- un rând în opening_hours și unul în tickets (atracțiile gratuite au price = 0).
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+
+CREATE OR ALTER VIEW dbo.vw_attraction_full
+WITH SCHEMABINDING
+AS
+SELECT a.attraction_name,
+       h.day_of_week,
+       h.open_time,
+       h.close_time,
+       h.is_closed,
+       t.ticket_type,
+       t.price,
+       t.currency
+FROM dbo.attractions a
+JOIN dbo.opening_hours h ON a.attraction_name = h.attraction_name
+JOIN dbo.tickets t ON a.attraction_name = t.attraction_name;
+GO
+
+-- Indexul clusterizat unic materializează view-ul; attraction_name e prima coloană din cheie
+CREATE UNIQUE CLUSTERED INDEX ix_vw_attraction_full
+ON dbo.vw_attraction_full (attraction_name, day_of_week, ticket_type);
+GO
@@ -0,0 +1,17 @@
+#!/bin/sh
+# Comanda de startup pentru Azure App Service (Configuration -> General settings -> Startup Command: startup.sh)
+# uvloop + httptools: event loop și parser HTTP în C, importante fiindcă toate apelurile (Search, OpenAI, SQL) sunt I/O.
+# --limit-concurrency: peste prag răspundem 503 imediat, în loc să acumulăm o coadă nelimitată.
+# Un singur worker implicit: cache-urile (L1, semantic, SQL), warm-up-ul și pool-ul SQL sunt per proces.
+# Cu WEB_CONCURRENCY > 1 fiecare worker are cache-ul lui, rulează propriul warm-up și deschide
+# până la SQL_POOL_MAX conexiuni; /cache/invalidate golește doar worker-ul care primește cererea.
+# Alternativ cu Gunicorn: gunicorn --chdir app main:app -k uvicorn.workers.UvicornWorker -w 1 --backlog 2048
+exec uvicorn main:app \
+    --app-dir app \
+    --host 0.0.0.0 \
+    --port "${PORT:-8000}" \
+    --loop uvloop \
+    --http httptools \
+    --workers "${WEB_CONCURRENCY:-1}" \
+    --backlog 2048 \
+    --limit-concurrency "${UVICORN_LIMIT_CONCURRENCY:-500}"